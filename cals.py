@@ -1,7 +1,9 @@
+import os
+import sys
 import typer
+import logging
 import datetime
-from rich.console import Console
-from rich.table import Table
+import functools
 from typing_extensions import Annotated
 from models import User, Macro, Food
 from database import (
@@ -11,13 +13,9 @@ from database import (
     create_macro,
     create_food,
     create_entry,
-    show_current_entry,
-    show_weekly_entries,
-    show_monthly_entries,
-    get_total_calories_today,
-    get_weekly_calories,
-    get_monthly_calories,
-    get_cal_goal,
+    show_day_bundle,
+    show_weekly_bundle,
+    show_monthly_bundle,
     get_all_foods,
     update_food_item,
     update_user,
@@ -25,36 +23,140 @@ from database import (
 )
 
 
-console, app = Console(), typer.Typer()
+app = typer.Typer()
 
-conn, cur = create_connection()
+# skip Rich's markup parsing and table layout when output is piped/redirected,
+# or when asked to with --plain / NO_COLOR (see main)
+PLAIN = False
 
-create_all_tables(conn, cur)
+# rendering a Table is slow for long diaries, so ask before going past this
+MAX_ROWS = 1000
+
+# shown in place of the goal for unknown users or users without a macro
+NO_GOAL = "no calorie goal set"
+
+
+@app.callback()
+def main(
+    plain: Annotated[bool, typer.Option(
+        "--plain", help="Print tab-separated rows without any styling."
+        )] = False
+):
+    """
+    A simple command line app to track your calories.
+    """
+
+    global PLAIN
+    PLAIN = plain or "NO_COLOR" in os.environ or not sys.stdout.isatty()
+
+    # database reports through logging, show its messages as plain lines
+    logging.basicConfig(level=logging.INFO, format="%(message)s",
+                        stream=sys.stdout)
+
+
+@functools.lru_cache(maxsize=1)
+def get_db():
+    """
+    Opens the database and creates its tables on first use. Called by each
+    command rather than main, so --help on a subcommand (which runs main
+    first) never touches the database.
+    """
+
+    conn, cur = create_connection()
+    create_all_tables(conn, cur)
+    return conn, cur
+
+
+def sqlite_today():
+    """
+    Today's date on SQLite's clock (UTC), the day DATE('now') and the
+    foodentries date default use, so the date shown matches the rows.
+    """
+
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+@functools.lru_cache(maxsize=1)
+def get_console():
+    """
+    Creates the Rich console on first use, Rich is slow to import and most
+    commands never render anything with it.
+    """
+
+    from rich.console import Console
+    return Console()
+
+
+@functools.lru_cache(maxsize=1)
+def column_styles():
+    """
+    Table column styles, parsed once instead of on every table construction.
+    """
+
+    from rich.style import Style
+    return {
+        "dim": Style(dim=True),
+        "red": Style(color="red"),
+        "green": Style(color="green"),
+        "magenta": Style(color="magenta"),
+        "purple": Style(color="purple"),
+        "dark_orange": Style(color="dark_orange"),
+        "light_sky_blue1": Style(color="light_sky_blue1"),
+    }
+
+
+def print_table(table):
+    """
+    Renders a table into a buffer and writes it to stdout in a single call.
+    """
+
+    console = get_console()
+    with console.capture() as capture:
+        console.print(table)
+    sys.stdout.write(capture.get())
+
+
+def cap_rows(rows):
+    """
+    Yields rows, asking for confirmation before rendering more than MAX_ROWS.
+    Piped output is never capped, there is nobody to ask.
+    """
+
+    for count, row in enumerate(rows):
+        if count == MAX_ROWS and not PLAIN and not typer.confirm(
+                f"More than {MAX_ROWS} rows, render all?"):
+            return
+        yield row
+
+
+def print_plain(rows):
+    """
+    Writes rows as tab-separated lines without any Rich styling.
+    """
+
+    sys.stdout.write("".join("\t".join(map(str, row)) + "\n" for row in rows))
 
 
 @app.command(short_help='Creates a new user.')
 def register(username: str, weight: int, weight_goal: int):
+    conn, cur = get_db()
     typer.echo(f"Attempting to create profile for {username}...")
-    conn, cur = create_connection()
-
     user = User(username, weight, weight_goal)
     create_user(user, conn, cur)
 
 
 @app.command(short_help='Creates a new macro for the specified user.')
 def macro(username: str, name: str, protein, fat, carbs, cal_goal: int):
+    conn, cur = get_db()
     typer.echo(f"Adding {name} macro for {username}...")
-    conn, cur = create_connection()
-
     macro = Macro(name, protein, fat, carbs, cal_goal)
     create_macro(username, macro, conn, cur)
 
 
 @app.command(short_help='Adds a new food item to the database.')
 def add(name: str, calories, protein, fat, carbs: int):
+    conn, cur = get_db()
     typer.echo(f"Adding food item {name} to the database...")
-    conn, cur = create_connection()
-
     food = Food(name, calories, protein, fat, carbs)
     create_food(food, conn, cur)
 
@@ -67,88 +169,104 @@ def entry(
         help="Date food was consumed. MUST be in YYYY-MM-DD format."
         )] = ""
 ):
+    conn, cur = get_db()
     if date:
         typer.echo(
             f"Adding {food_name} to {username}'s food diary for {date}."
             )
-        conn, cur = create_connection()
         adjust_entry(username, food_name, date, conn, cur)
         return
-    today = datetime.datetime.now().isoformat()
+    today = sqlite_today()  # display only, SQLite fills date/time
     typer.echo(f"Adding {food_name} to {username}'s food diary for {today}.")
 
-    conn, cur = create_connection()
     create_entry(username, food_name, conn, cur)
 
 
 @app.command(short_help='Show all entries for the current day.')
 def show(username: str):
-    today = datetime.date.today()
+    conn, cur = get_db()
+    today = sqlite_today()
     typer.echo(f"Printing {username}'s food diary for {today}")
 
-    conn, cur = create_connection()
-    entries = show_current_entry(username, conn, cur)
+    entries, total_cals, cal_goal = show_day_bundle(username, conn, cur)
 
-    conn, cur = create_connection()
-    total_cals = get_total_calories_today(username, conn, cur)
+    if PLAIN:
+        print_plain(entries)
+        typer.echo(f"Total Calories: {total_cals} / "
+                   f"{NO_GOAL if cal_goal is None else cal_goal}")
+        return
 
-    conn, cur = create_connection()
-    cal_goal = get_cal_goal(username, conn, cur)
+    from rich.table import Table
+    from rich.text import Text
+    console, styles = get_console(), column_styles()
 
-    console.print("[bold magenta]Food Diary:  [/bold magenta]" + f"{today}")
+    console.print(f"[bold magenta]Food Diary:  [/bold magenta]{today}")
 
     table = Table(show_header=True)
-    table.add_column("User", style="dim", header_style="red", width=6)
+    table.add_column("User", style=styles["dim"], header_style=styles["red"],
+                     width=6)
     table.add_column("Meal", justify="center", min_width=20)
-    table.add_column("Calories", header_style="green", style="green",
-                     min_width=12)
-    table.add_column("Time", style="magenta", header_style="magenta",
-                     min_width=8)
+    table.add_column("Calories", header_style=styles["green"],
+                     style=styles["green"], min_width=12)
+    table.add_column("Time", style=styles["magenta"],
+                     header_style=styles["magenta"], min_width=8)
 
-    for i, entry in enumerate(entries):
-        table.add_row(entry[0], entry[1], str(entry[2]), str(entry[3]))
+    for entry in cap_rows(entries):
+        table.add_row(*map(Text, entry))
 
-    console.print(table)
+    print_table(table)
 
     console.print(
-        f"[green3] Total Calories: {total_cals} / [/green3]" +
-        f"[bold red]{cal_goal}[/bold red]"
+        f"[green3] Total Calories: {total_cals} / [/green3]"
+        f"[bold red]{NO_GOAL if cal_goal is None else cal_goal}[/bold red]"
         )
 
-    if total_cals > cal_goal:
+    if cal_goal is None:
+        console.print("Add one with the macro command.")
+    elif total_cals > cal_goal:
         console.print(
-            ":warning:" + " " +
+            ":warning: "
             "[bold red]You have exceeded your daily calorie goal![/bold red]"
-            + ":warning:"
+            ":warning:"
             )
     else:
         console.print(
-            ":white_heavy_check_mark:" + " " +
+            ":white_heavy_check_mark: "
             "[bold green]You are within your daily calorie goal![/]"
-            + ":white_heavy_check_mark:"
+            ":white_heavy_check_mark:"
         )
 
 
 @app.command(short_help="Retrieves all foods in the database.")
 def foods():
+    conn, cur = get_db()
     typer.echo("Retrieving all food items...")
 
-    conn, cur = create_connection()
     foods = get_all_foods(conn, cur)
 
+    if PLAIN:
+        print_plain(foods)
+        return
+
+    from rich.table import Table
+    from rich.text import Text
+    styles = column_styles()
+
     table = Table()
     table.add_column("Name")
-    table.add_column("Calories", header_style="green", style="green")
-    table.add_column("Protein", header_style="purple", style="purple")
-    table.add_column("Fat", header_style="dark_orange", style="dark_orange")
-    table.add_column("Carbs", header_style="light_sky_blue1",
-                     style="light_sky_blue1")
+    table.add_column("Calories", header_style=styles["green"],
+                     style=styles["green"])
+    table.add_column("Protein", header_style=styles["purple"],
+                     style=styles["purple"])
+    table.add_column("Fat", header_style=styles["dark_orange"],
+                     style=styles["dark_orange"])
+    table.add_column("Carbs", header_style=styles["light_sky_blue1"],
+                     style=styles["light_sky_blue1"])
 
-    for i, food in enumerate(foods):
-        table.add_row(food[1], str(food[2]), str(food[3]), str(food[4]),
-                      str(food[5]))
+    for food in cap_rows(foods):
+        table.add_row(*map(Text, food))
 
-    console.print(table)
+    print_table(table)
 
 
 @app.command(short_help="Update a food item, user, or macro.")
@@ -158,50 +276,41 @@ def upd(
     macro: Annotated[str, typer.Option(help="given name is a macro.")] = ""
 
 ):
+    conn, cur = get_db()
+    console = get_console()
     if food:
         console.print(
-            f"Please enter the values you would like to UPDATE for {food}" +
+            f"Please enter the values you would like to UPDATE for {food}"
             "(type: [bold red]food)[/bold red]"
             )
-        cols, food_item = [], Food(food)  # store columns user wants to update
-
-        calories = input("Calories: ")
-        cols.append("calories") if calories != "" else None
-        food_item.calories = int(calories) if calories != "" else None
-
-        protein = input("Protein: ")
-        cols.append("protein") if protein != "" else None
-        food_item.protein = int(protein) if protein != "" else None
-
-        fat = input("Fat: ")
-        cols.append("fat") if fat != "" else None
-        food_item.fat = int(fat) if fat != "" else None
-
-        carbs = input("Carbs: ")
-        cols.append("carbs") if carbs != "" else None
-        food_item.carbs = int(carbs) if carbs != "" else None
-
-        conn, cur = create_connection()
-        typer.echo("Updating food item...")
-        update_food_item(food_item, cols, conn, cur)
+        values = {}  # store columns user wants to update
+
+        for col, prompt in (("calories", "Calories: "),
+                            ("protein", "Protein: "), ("fat", "Fat: "),
+                            ("carbs", "Carbs: ")):
+            value = input(prompt)
+            if value != "":
+                values[col] = int(value)
+
+        if values:
+            typer.echo("Updating food item...")
+            update_food_item(Food(food, **values), list(values), conn, cur)
     if user:
         console.print(
-            f"Please enter the values you would like to UPDATE for {user}  " +
+            f"Please enter the values you would like to UPDATE for {user}  "
             "(type: [bold red]user)[/bold red]"
             )
-        cols, user = [], User(user)
-
-        cur_weight = input("Weight: ")
-        cols.append("weight") if cur_weight != "" else None
-        user.weight = int(cur_weight) if cur_weight != "" else None
+        values = {}
 
-        weight_goal = input("Weight Goal: ")
-        cols.append("weightGoal") if weight_goal != "" else None
-        user.weight_goal = weight_goal if weight_goal != "" else None
+        for col, prompt in (("weight", "Weight: "),
+                            ("weightGoal", "Weight Goal: ")):
+            value = input(prompt)
+            if value != "":
+                values[col] = int(value)
 
-        conn, cur = create_connection()
-        typer.echo("Updating user profile...")
-        update_user(user, cols, conn, cur)
+        if values:
+            typer.echo("Updating user profile...")
+            update_user(User(user, **values), list(values), conn, cur)
 
     if macro:
         pass
@@ -209,93 +318,113 @@ def upd(
 
 @app.command(short_help="Shows the weekly entries for the given user.")
 def weekly(username: str):
+    conn, cur = get_db()
     typer.echo(f"Displaying {username}'s weekly food diary...")
 
-    conn, cur = create_connection()
-    entries = show_weekly_entries(username, conn, cur)
+    entries, weekly_cals, cal_goal = show_weekly_bundle(username, conn, cur)
+    if cal_goal is not None:
+        cal_goal *= 7
+
+    if PLAIN:
+        print_plain(entries)
+        typer.echo(f"Weekly Calories: {weekly_cals} / "
+                   f"{NO_GOAL if cal_goal is None else cal_goal}")
+        return
+
+    from rich.table import Table
+    from rich.text import Text
+    console, styles = get_console(), column_styles()
+
     console.print("[bold magenta]Weekly Food Diary:  [/bold magenta]")
 
     table = Table(show_header=True)
-    table.add_column("User", style="dim", header_style="red", width=6)
+    table.add_column("User", style=styles["dim"], header_style=styles["red"],
+                     width=6)
     table.add_column("Meal", justify="center", min_width=20)
-    table.add_column("Calories", header_style="green", style="green",
-                     min_width=12)
-    table.add_column("Date", style="magenta", header_style="magenta",
-                     min_width=8)
-
-    for i, entry in enumerate(entries):
-        table.add_row(entry[0], entry[1], str(entry[2]), str(entry[3]))
+    table.add_column("Calories", header_style=styles["green"],
+                     style=styles["green"], min_width=12)
+    table.add_column("Date", style=styles["magenta"],
+                     header_style=styles["magenta"], min_width=8)
 
-    console.print(table)
+    for entry in cap_rows(entries):
+        table.add_row(*map(Text, entry))
 
-    conn, cur = create_connection()
-    weekly_cals = get_weekly_calories(username, conn, cur)
-    conn, cur = create_connection()
-    cal_goal = get_cal_goal(username, conn, cur)
-    cal_goal *= 7
+    print_table(table)
 
     console.print(
-        f"[green3]Weekly Calories: {weekly_cals} / [/green3]" +
-        f"[bold red]{cal_goal}[/bold red]"
+        f"[green3]Weekly Calories: {weekly_cals} / [/green3]"
+        f"[bold red]{NO_GOAL if cal_goal is None else cal_goal}[/bold red]"
         )
 
-    if weekly_cals > cal_goal:
+    if cal_goal is None:
+        console.print("Add one with the macro command.")
+    elif weekly_cals > cal_goal:
         console.print(
-            ":warning:" + " " +
+            ":warning: "
             "[bold red]You have exceeded your weekly calorie goal![/bold red]"
-            + ":warning:"
+            ":warning:"
             )
     else:
         console.print(
-            ":white_heavy_check_mark:" + " " +
+            ":white_heavy_check_mark: "
             "[bold green]You are within your weekly calorie goal![/bold green]"
-            + ":white_heavy_check_mark:"
+            ":white_heavy_check_mark:"
             )
 
 
 @app.command(short_help="Shows the monthly entries for the given user.")
 def monthly(username: str):
+    conn, cur = get_db()
     typer.echo(f"Displaying {username}'s monthly food diary...")
 
-    conn, cur = create_connection()
-    entries = show_monthly_entries(username, conn, cur)
+    entries, monthly_cals, cal_goal = show_monthly_bundle(username, conn, cur)
+    if cal_goal is not None:
+        cal_goal *= 30
+
+    if PLAIN:
+        print_plain(entries)
+        typer.echo(f"Monthly Calories: {monthly_cals} / "
+                   f"{NO_GOAL if cal_goal is None else cal_goal}")
+        return
+
+    from rich.table import Table
+    from rich.text import Text
+    console, styles = get_console(), column_styles()
+
     console.print("[bold magenta]Monthly Food Diary:  [/bold magenta]")
 
     table = Table(show_header=True)
-    table.add_column("User", style="dim", header_style="red", width=6)
+    table.add_column("User", style=styles["dim"], header_style=styles["red"],
+                     width=6)
     table.add_column("Meal", justify="center", min_width=20)
-    table.add_column("Calories", header_style="green", style="green",
-                     min_width=12)
-    table.add_column("Date", style="magenta", header_style="magenta",
-                     min_width=8)
-
-    for i, entry in enumerate(entries):
-        table.add_row(entry[0], entry[1], str(entry[2]), str(entry[3]))
+    table.add_column("Calories", header_style=styles["green"],
+                     style=styles["green"], min_width=12)
+    table.add_column("Date", style=styles["magenta"],
+                     header_style=styles["magenta"], min_width=8)
 
-    console.print(table)
+    for entry in cap_rows(entries):
+        table.add_row(*map(Text, entry))
 
-    conn, cur = create_connection()
-    monthly_cals = get_monthly_calories(username, conn, cur)
-    conn, cur = create_connection()
-    cal_goal = get_cal_goal(username, conn, cur)
-    cal_goal *= 30
+    print_table(table)
 
     console.print(
-        f"[green3]Monthly Calories: {monthly_cals} / [/green3]" +
-        f"[bold red]{cal_goal}[/bold red]"
+        f"[green3]Monthly Calories: {monthly_cals} / [/green3]"
+        f"[bold red]{NO_GOAL if cal_goal is None else cal_goal}[/bold red]"
         )
 
-    if monthly_cals > cal_goal:
+    if cal_goal is None:
+        console.print("Add one with the macro command.")
+    elif monthly_cals > cal_goal:
         console.print(
-            ":warning:" + " " +
+            ":warning: "
             "[bold red]You have exceeded your monthly calorie goal![/bold red]"
-            + ":warning:"
+            ":warning:"
             )
     else:
         console.print(
-            ":white_heavy_check_mark:" + " " +
+            ":white_heavy_check_mark: "
             "[bold green]You are within your monthly calorie goal![/]"
-            + ":white_heavy_check_mark:"
+            ":white_heavy_check_mark:"
         )
 
 
@@ -1,11 +1,292 @@
 import sqlite3
-import datetime
+import functools
+import itertools
+import queue
+import threading
+import contextlib
+import logging
 from models import User, Macro, Food
 
+logger = logging.getLogger(__name__)
+
+
+# Applied to every connection: temporary tables and indices stay in memory,
+# a 64 MiB page cache keeps hot pages resident for the life of the
+# connection, and busy_timeout waits out another writer instead of failing.
+PRAGMA_SQL = """
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-65536;
+PRAGMA busy_timeout=3000;
+"""
+
+# Only meaningful for a database backed by a file, skipped for :memory:. WAL
+# with synchronous=NORMAL avoids an fsync on every commit, and a 256 MiB
+# memory map serves reads straight from the OS page cache.
+PRAGMA_FILE_SQL = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA mmap_size=268435456;
+"""
+
+# Schema of the calories database, keyed by table name. Bump SCHEMA_VERSION
+# whenever it changes so existing databases pick up the new definitions.
+SCHEMA_VERSION = 4
+SCHEMA = {
+    # username, current weight and goal weight.
+    "users": """
+    CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            weight INTEGER,
+            weightGoal INTEGER)""",
+    # calorie goal and its percentage split into protein, fat and carbs.
+    "macros": """
+    CREATE TABLE IF NOT EXISTS macros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            proteinAllocation INTEGER,
+            fatAllocation INTEGER,
+            carbAllocation INTEGER,
+            calGoal INTEGER)""",
+    # intersection table linking users to their macros, indexed on userID
+    # for the calorie goal lookup.
+    "usermacros": """
+    CREATE TABLE IF NOT EXISTS usermacros (
+            userID INTEGER REFERENCES users(id),
+            macroID INTEGER REFERENCES macros(id));
+    CREATE INDEX IF NOT EXISTS idx_usermacros_user
+            ON usermacros(userID)""",
+    # name and total calories, protein, fat and carbs of a food item. The
+    # food list is shown highest calories first, the index returns it in
+    # that order with every listed column, so neither a sort nor the table
+    # is needed.
+    "foods": """
+    CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            calories INTEGER NOT NULL,
+            protein INTEGER,
+            fat INTEGER,
+            carbs INTEGER);
+    CREATE INDEX IF NOT EXISTS idx_foods_calories
+            ON foods(calories DESC, name, protein, fat, carbs)""",
+    # intersection table recording a food eaten by a user, the date defaults
+    # to the current day and the time to when the entry was created. Every
+    # diary query filters on (userID, date) and reads foodID and time, so the
+    # index covers all four and the lookup never touches the table itself.
+    # It replaces the narrower idx_foodentries_user_date of schema version 2.
+    "foodentries": """
+    CREATE TABLE IF NOT EXISTS foodentries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            foodID INTEGER REFERENCES foods(id),
+            userID INTEGER REFERENCES users(id),
+            date DATETIME DEFAULT CURRENT_DATE,
+            time DATETIME DEFAULT CURRENT_TIME);
+    DROP INDEX IF EXISTS idx_foodentries_user_date;
+    CREATE INDEX IF NOT EXISTS idx_foodentries_diary
+            ON foodentries(userID, date, foodID, time)""",
+}
+
+# Id lookups by unique name, keyed by (table, column) for _lookup_id.
+_SQL_LOOKUP_ID = {
+    ("users", "username"): "SELECT id FROM users WHERE username=?",
+    ("foods", "name"): "SELECT id FROM foods WHERE name=?",
+}
+
+# Hot read-path queries, kept as module constants so each one is compiled
+# once per connection and then served from sqlite3's statement cache. Columns
+# that are only ever displayed are cast to TEXT by SQLite rather than Python.
+_SQL_CAL_GOAL = """
+SELECT m.calGoal
+FROM usermacros
+JOIN macros AS m ON usermacros.macroID = m.id
+WHERE usermacros.userID = (SELECT id FROM users WHERE username = ?)
+ORDER BY usermacros.macroID
+DESC LIMIT 1
+"""
+
+_SQL_ENTRIES_TODAY = """
+SELECT foodentries.time, foods.name, foods.calories
+FROM foodentries
+JOIN foods ON foodentries.foodID = foods.id
+WHERE foodentries.userID = (SELECT id FROM users WHERE username = ?)
+AND foodentries.date = DATE('now')
+ORDER BY foodentries.time
+"""
+
+_SQL_ENTRIES_WEEK = """
+SELECT users.username, foods.name, foods.calories, foodentries.date
+FROM foodentries
+JOIN users ON foodentries.userID = users.id
+JOIN foods ON foodentries.foodID = foods.id
+WHERE foodentries.date BETWEEN DATE('now', 'weekday 0', '-6 days') AND DATE
+('now', 'weekday 0') AND users.username = ?
+"""
+
+_SQL_ENTRIES_MONTH = """
+SELECT users.username, foods.name, foods.calories, foodentries.date
+FROM foodentries
+JOIN users ON foodentries.userID = users.id
+JOIN foods ON foodentries.foodID = foods.id
+WHERE foodentries.date BETWEEN DATE('now', 'start of month') AND
+DATE('now', 'start of month', '+1 month', '-1 day') AND users.username = ?
+ORDER BY foodentries.date ASC
+"""
+
+_SQL_TOTAL_TODAY = """
+SELECT SUM(foods.calories)
+FROM foodentries
+JOIN users ON foodentries.userID = users.id
+JOIN foods ON foodentries.foodID = foods.id
+WHERE users.username = ? AND date = DATE('now')
+"""
+
+_SQL_TOTAL_WEEK = """
+SELECT SUM(foods.calories)
+FROM foodentries
+JOIN users ON foodentries.userID = users.id
+JOIN foods ON foodentries.foodID = foods.id
+WHERE foodentries.date BETWEEN DATE('now', 'weekday 0', '-6 days') AND DATE
+('now', 'weekday 0') AND users.username = ?
+"""
+
+_SQL_TOTAL_MONTH = """
+SELECT SUM(foods.calories)
+FROM foodentries
+JOIN users ON foodentries.userID = users.id
+JOIN foods ON foodentries.foodID = foods.id
+WHERE foodentries.date BETWEEN DATE('now', 'start of month') AND
+DATE('now', 'start of month', '+1 month', '-1 day') AND users.username = ?
+"""
+
+_SQL_BUNDLE_TODAY = """
+SELECT users.username, foods.name, CAST(foods.calories AS TEXT),
+foodentries.time, SUM(foods.calories) OVER () AS total,
+(SELECT m.calGoal FROM usermacros
+ JOIN macros AS m ON usermacros.macroID = m.id
+ WHERE usermacros.userID = users.id
+ ORDER BY usermacros.macroID DESC LIMIT 1) AS goal
+FROM users
+LEFT JOIN foodentries ON foodentries.userID = users.id AND
+foodentries.date = DATE('now')
+LEFT JOIN foods ON foodentries.foodID = foods.id
+WHERE users.username = ?
+ORDER BY foodentries.time
+"""
+
+_SQL_BUNDLE_WEEK = """
+SELECT users.username, foods.name, CAST(foods.calories AS TEXT),
+foodentries.date, SUM(foods.calories) OVER () AS total,
+(SELECT m.calGoal FROM usermacros
+ JOIN macros AS m ON usermacros.macroID = m.id
+ WHERE usermacros.userID = users.id
+ ORDER BY usermacros.macroID DESC LIMIT 1) AS goal
+FROM users
+LEFT JOIN foodentries ON foodentries.userID = users.id AND
+foodentries.date BETWEEN DATE('now', 'weekday 0', '-6 days') AND DATE
+('now', 'weekday 0')
+LEFT JOIN foods ON foodentries.foodID = foods.id
+WHERE users.username = ?
+"""
+
+_SQL_BUNDLE_MONTH = """
+SELECT users.username, foods.name, CAST(foods.calories AS TEXT),
+foodentries.date, SUM(foods.calories) OVER () AS total,
+(SELECT m.calGoal FROM usermacros
+ JOIN macros AS m ON usermacros.macroID = m.id
+ WHERE usermacros.userID = users.id
+ ORDER BY usermacros.macroID DESC LIMIT 1) AS goal
+FROM users
+LEFT JOIN foodentries ON foodentries.userID = users.id AND
+foodentries.date BETWEEN DATE('now', 'start of month') AND
+DATE('now', 'start of month', '+1 month', '-1 day')
+LEFT JOIN foods ON foodentries.foodID = foods.id
+WHERE users.username = ?
+ORDER BY foodentries.date ASC
+"""
+
+_SQL_ALL_FOODS = """
+SELECT name, CAST(calories AS TEXT), IFNULL(CAST(protein AS TEXT), ''),
+IFNULL(CAST(fat AS TEXT), ''), IFNULL(CAST(carbs AS TEXT), '')
+FROM foods
+ORDER BY calories DESC
+"""
+
+# Write statements, shared by the single and bulk helpers so both hit the
+# same cached statement. The entry inserts resolve the user and food ids
+# themselves, and the usermacros insert links the macro inserted just before
+# it, so none of the ids have to be looked up from Python first.
+_SQL_INSERT_USER = """
+INSERT INTO users(username, weight, weightGoal) VALUES (?, ?, ?)
+"""
+
+_SQL_INSERT_MACRO = """
+INSERT INTO macros(name, proteinAllocation, fatAllocation, carbAllocation,
+calGoal) VALUES (?, ?, ?, ?, ?)
+"""
+
+_SQL_INSERT_USERMACRO = """
+INSERT INTO usermacros(userID, macroID)
+SELECT id, last_insert_rowid() FROM users WHERE username = ?
+"""
+
+_SQL_INSERT_FOOD = """
+INSERT INTO foods(name, calories, protein, fat, carbs) VALUES (?, ?, ?, ?, ?)
+"""
+
+_SQL_INSERT_ENTRY = """
+INSERT INTO foodentries(foodID, userID)
+SELECT foods.id, users.id FROM foods, users
+WHERE foods.name = ? AND users.username = ?
+"""
+
+_SQL_ADJUST_ENTRY = """
+INSERT INTO foodentries(foodID, userID, date)
+SELECT foods.id, users.id, ? FROM foods, users
+WHERE foods.name = ? AND users.username = ?
+"""
+
+
+def _open_connection(db_file, check_same_thread=True):
+    """
+    Opens a new connection in autocommit mode and applies PRAGMA_SQL, plus
+    PRAGMA_FILE_SQL unless the database is in memory.
+
+    Args:
+        db_file (str): Path to the SQLite database file, ":memory:", or a
+            "file:" URI such as "file::memory:?cache=shared"
+        check_same_thread (bool): Whether only the opening thread may use
+            the connection (default: True)
+
+    Returns:
+        conn (sqlite3.Connection): A connection object
+    """
+
+    uri = db_file.startswith("file:")
+    conn = sqlite3.connect(db_file, isolation_level=None,
+                           cached_statements=256,
+                           check_same_thread=check_same_thread, uri=uri)
+    conn.executescript(PRAGMA_SQL)
+    in_memory = db_file == ":memory:" or (
+        uri and (db_file.startswith("file::memory:") or
+                 "mode=memory" in db_file))
+    if not in_memory:
+        conn.executescript(PRAGMA_FILE_SQL)
+    return conn
+
+
+# the shared connection of each thread, as (db_file, conn, cur)
+_local = threading.local()
+
 
 def create_connection(db_file="calories.db"):
     """
-    Establishes a connection to the calories database.
+    Establishes a connection to the calories database. The connection is
+    cached per thread, so every caller in a thread shares the same
+    connection until it is closed or another db_file is asked for, which
+    closes the previous one.
+    It runs in autocommit mode; writes open their own transaction with
+    transaction(conn).
 
     Args:
         db_file (str): Path to the SQLite database file (default: "calories.db)
@@ -16,190 +297,223 @@ def create_connection(db_file="calories.db"):
             curr (sqlite3.Cursor): A cursor object for executing SQL queries
     """
 
+    shared = getattr(_local, "shared", None)
+    if shared is not None:
+        if shared[0] == db_file:
+            return shared[1:]
+        close_connection(shared[1])
+
     try:
-        conn = sqlite3.connect("calories.db")
-        cur = conn.cursor()
-        return conn, cur
+        conn = _open_connection(db_file)
+        _local.shared = (db_file, conn, conn.cursor())
+        return _local.shared[1:]
     except sqlite3.Error as e:
-        print(f"ERROR: could not establish connection to '{db_file}' ({e})")
+        logger.error("ERROR: could not establish connection to '%s' (%s)",
+                     db_file, e)
 
 
-def create_users_table(conn, cur):
+def close_connection(conn):
     """
-    Creates the users table.
+    Closes the shared connection. The next create_connection call opens a
+    new one.
 
     Args:
-        conn (sqlite3.Connection): A connection object
-        curr (sqlite3.Cursor): A cursor object for executing SQL queries
-
-    Schema:
-        id: primary key
-        username: specified username
-        weight: the user's current weight
-        weightGoal: the user's goal weight
+        conn (sqlite3.Connection): The connection returned by create_connection
     """
 
-    try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                weight INTEGER,
-                weightGoal INTEGER);
-                """)
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"ERROR: could not create users table! ({e})")
-    finally:
-        conn.close()
+    conn.close()
+    shared = getattr(_local, "shared", None)
+    if shared is not None and shared[1] is conn:
+        del _local.shared
 
 
-def create_macros_table(conn, cur):
+@contextlib.contextmanager
+def transaction(conn):
     """
-    Creates the macros table.
+    Runs the body of the with block in one write transaction. Commits when
+    the block exits cleanly and rolls back if it raises, re-raising the
+    error for the caller to handle. The connection is left open either way.
+    Inside an open transaction (see bulk) the block runs under a savepoint
+    instead, so a failure only undoes the block's own writes.
 
     Args:
-        conn (sqlite3.Connection): A connection object
-        curr (sqlite3.Cursor): A cursor object for executing SQL queries
-
-    Schema:
-        id: primary key
-        name: name of the macro
-        proteinAllocation: the allocated percentage of calories towards protein
-        fatAllocation: the allocated percentage of calories towards fat
-        carbAllocation: the allocated percentage of calories towards carbs
-        calGoal: the daily caloric intake goal for this macro
+        conn (sqlite3.Connection): A connection in autocommit mode
     """
 
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT write")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO write")
+            raise
+        finally:
+            conn.execute("RELEASE write")
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS macros (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                proteinAllocation INTEGER,
-                fatAllocation INTEGER,
-                carbAllocation INTEGER,
-                calGoal INTEGER);
-                """)
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"ERROR: could not create macros table! ({e})")
-    finally:
-        conn.close()
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
 
 
-def create_usermacros_table(conn, cur):
+def bulk(conn):
     """
-    Creates the usermacros intersection table.
+    Groups any number of helper calls into a single transaction, so a burst
+    of writes is committed (and synced) once instead of once per call:
+
+        with bulk(conn):
+            for food in foods:
+                create_food(food, conn, cur)
 
     Args:
-        conn (sqlite3.Connection): A connection object
-        curr (sqlite3.Cursor): A cursor object for executing SQL queries
+        conn (sqlite3.Connection): A connection in autocommit mode
+    """
+
+    return transaction(conn)
 
-    Schema:
-        userID: fk references users(id)
-        macroID: fk references macros(id)
+
+class ConnectionPool:
+    """
+    A bounded pool of connections to one database file, for callers that
+    need more than the single shared connection. Connections are opened
+    lazily, up to size, and handed back to the pool after each use. Each
+    connection is pooled with its cursor, so a checkout allocates nothing.
+    The pool may be shared between threads: connections are opened with
+    check_same_thread=False, and a checked out connection belongs to one
+    thread until it is returned. Every helper runs on the connection it is
+    given, so a pool over "file::memory:?cache=shared" shares one in-memory
+    database (a plain ":memory:" would give each connection its own).
+
+    db_file: str
+    size: int
     """
 
-    try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS usermacros (
-                userID INTEGER REFERENCES users(id),
-                macroID INTEGER REFERENCES macros(id));
-                """)
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"ERROR: could not create usermacros table! ({e})")
-    finally:
-        conn.close()
+    def __init__(self, db_file="calories.db", size=5):
+
+        self.db_file = db_file
+        self.size = size
+        self._idle = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """
+        Checks a connection out of the pool, opening one if none is idle and
+        the pool is not full, otherwise waiting for one to be returned.
+
+        Yields:
+            A tuple containing:
+                conn (sqlite3.Connection): A connection object
+                curr (sqlite3.Cursor): A cursor object for executing SQL
+        """
+
+        conn, cur = self._checkout()
+        try:
+            yield conn, cur
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put((conn, cur))
+
+    def _checkout(self):
+        """
+        Returns an idle (conn, cur) pair, a newly opened one, or blocks for
+        one.
+        """
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                conn = _open_connection(self.db_file,
+                                        check_same_thread=False)
+                self._opened += 1
+                return conn, conn.cursor()
+        return self._idle.get()
+
+    def close(self):
+        """
+        Closes every idle connection in the pool.
+        """
+
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+pool = ConnectionPool()
 
 
-def create_foods_table(conn, cur):
+def create_user(user: User, conn, cur):
     """
-    Creates the foods table.
+    Create a user.
 
     Args:
+        user (User): a User object
         conn (sqlite3.Connection): A connection object
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
 
-    Schema:
-        id: pk
-        name: name of the food item
-        calories: total calories
-        protein: total grams of protein
-        fat: total grams of fat
-        carbs: total grams of carbs
+    Returns:
+        user_id: the id of the new user, or None if it was not created.
     """
 
     try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS foods (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                calories INTEGER NOT NULL,
-                protein INTEGER,
-                fat INTEGER,
-                carbs INTEGER);
-                """)
-        conn.commit()
+        with transaction(conn):
+            cur.execute(_SQL_INSERT_USER,
+                        (user.username, user.weight, user.weightGoal))
+        logger.info("Welcome, %s.", user.username)
+        return cur.lastrowid
     except sqlite3.Error as e:
-        print(f"ERROR: could not create foods table! ({e})")
-    finally:
-        conn.close()
+        logger.error("ERROR: could not create user! (%s)", e)
 
 
-def create_foodentries_table(conn, cur):
+def create_users(users, conn, cur):
     """
-    Creates the foodentries intersection table.
+    Creates many users with a single prepared statement and one commit.
 
     Args:
+        users: an iterable of User objects
         conn (sqlite3.Connection): A connection object
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
-
-    Schema:
-        id: pk
-        foodID: fk references foods(id)
-        userID: fk references users(id)
-        date: date of the entry, defaults to the current day
-        time: the time the entry was created
     """
 
     try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS foodentries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                foodID INTEGER REFERENCES foods(id),
-                userID INTEGER REFERENCES users(id),
-                date DATETIME DEFAULT CURRENT_DATE,
-                time DATETIME DEFAULT CURRENT_TIME
-                );
-                """)
-        conn.commit()
+        with transaction(conn):
+            cur.executemany(_SQL_INSERT_USER,
+                            [(user.username, user.weight, user.weightGoal)
+                             for user in users])
+        logger.info("Created %s users.", cur.rowcount)
     except sqlite3.Error as e:
-        print(f"ERROR: could not create foodentries table! ({e})")
-    finally:
-        conn.close()
+        logger.error("ERROR: could not create users! (%s)", e)
 
 
-def create_user(user: User, conn, cur):
+def _lookup_id(table: str, col: str, value, cur):
     """
-    Create a user.
+    Returns the id of the row in table whose col equals value, or None if
+    there is no such row. Only the (table, col) pairs in _SQL_LOOKUP_ID can
+    be looked up.
 
     Args:
-        user (User): a User object
-        conn (sqlite3.Connection): A connection object
+        table: the table to search.
+        col: the unique column to match value against.
+        value: the value to look up.
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
     """
 
-    sql = "INSERT INTO users(username, weight, weightGoal) VALUES (?, ?, ?)"
-    try:
-        cur.execute(sql, (user.username, user.weight, user.weightGoal))
-        conn.commit()
-        print(f"Welcome, {user.username}.")
-    except sqlite3.Error as e:
-        print(f"ERROR: could not create user! ({e})")
-    finally:
-        conn.close()
+    row = cur.execute(_SQL_LOOKUP_ID[table, col], (value,)).fetchone()
+    return row[0] if row else None
 
 
 def select_specific_user(username: str, conn, cur) -> str:
@@ -211,15 +525,48 @@ def select_specific_user(username: str, conn, cur) -> str:
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
 
     Returns:
-        user_id: the id of the user specified
+        user_id: the id of the user specified, or None if there is none.
     """
-    sql = "SELECT id FROM users WHERE username=?"
     try:
-        cur.execute(sql, (username,))
-        user_id = cur.fetchone()[0]
-        return user_id
+        return _lookup_id("users", "username", username, cur)
     except sqlite3.Error as e:
-        print(f"Could not fetch the id of the user: {username}! ({e})")
+        logger.error("Could not fetch the id of the user: %s! (%s)",
+                     username, e)
+
+
+# Columns update_user/update_food_item may set. Column names are spliced
+# into the UPDATE text, so anything else is rejected rather than quoted.
+_UPDATABLE_COLS = {
+    "users": frozenset(("weight", "weightGoal")),
+    "foods": frozenset(("calories", "protein", "fat", "carbs")),
+}
+
+
+@functools.lru_cache(maxsize=32)
+def _update_sql(table: str, key: str, cols: tuple) -> str:
+    """
+    Builds the UPDATE statement for a set of columns. Memoized so the same
+    column subset always yields the same SQL and hits the statement cache.
+
+    Args:
+        table: the table to update.
+        key: the column identifying the row to update.
+        cols: a tuple of the columns to be updated, sorted by the callers so
+            any order of the same columns shares one statement.
+
+    Returns:
+        sql: the UPDATE statement.
+
+    Raises:
+        ValueError: if a column is not in _UPDATABLE_COLS for the table.
+    """
+
+    bad_cols = set(cols) - _UPDATABLE_COLS[table]
+    if bad_cols:
+        raise ValueError(f"cannot update {', '.join(sorted(bad_cols))} in "
+                         f"{table}")
+    set_clause = ", ".join(f"{col} = ?" for col in cols)
+    return f"UPDATE {table} SET {set_clause} WHERE {key} = ?"
 
 
 def update_user(user: User, cols_to_update: list, conn, cur):
@@ -233,24 +580,16 @@ def update_user(user: User, cols_to_update: list, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
     """
 
-    set_clause = ", ".join(f"{col} = ?" for col in cols_to_update)
-
-    sql = f"""
-    UPDATE users
-    SET {set_clause}
-    WHERE username = ?
-    """
-
-    values = [getattr(user, col) for col in cols_to_update] + [user.username]
+    cols = tuple(sorted(cols_to_update))
+    sql = _update_sql("users", "username", cols)
+    values = [getattr(user, col) for col in cols] + [user.username]
 
     try:
         cur.execute(sql, tuple(values))
-        conn.commit()
-        print(f"Successfully updated {user.username} in the database.")
+        logger.info("Successfully updated %s in the database.", user.username)
     except sqlite3.Error as e:
-        print(f"ERROR: Could not update {user.username}'s profile! ({e})")
-    finally:
-        conn.close()
+        logger.error("ERROR: Could not update %s's profile! (%s)",
+                     user.username, e)
 
 
 def create_macro(username: str, macro: Macro, conn, cur):
@@ -263,25 +602,17 @@ def create_macro(username: str, macro: Macro, conn, cur):
         conn (sqlite3.Connection): A connection object
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
     """
-    user_id = select_specific_user(username, conn, cur)
-
-    sql = """
-    INSERT INTO macros(id, name, proteinAllocation, fatAllocation,
-    carbAllocation, calGoal) VALUES (?, ?, ?, ?, ?, ?)
-    """
-    usermacros_sql = "INSERT INTO usermacros(userID, macroID) VALUES (?, ?)"
     try:
-        cur.execute(sql, (None, macro.name, macro.protein_pct, macro.fat_pct,
-                          macro.carb_pct, macro.cal_goal))
-        conn.commit()
-        macro_id = cur.lastrowid
-        cur.execute(usermacros_sql, (user_id, macro_id))
-        conn.commit()
-        print(f"Recorded {macro.name} for user {username}")
+        with transaction(conn):
+            cur.execute(_SQL_INSERT_MACRO,
+                        (macro.name, macro.protein_pct, macro.fat_pct,
+                         macro.carb_pct, macro.cal_goal))
+            cur.execute(_SQL_INSERT_USERMACRO, (username,))
+            if not cur.rowcount:
+                raise sqlite3.IntegrityError(f"no user {username}")
+        logger.info("Recorded %s for user %s", macro.name, username)
     except sqlite3.Error as e:
-        print(f"ERROR: Could not record macro {macro.name}! ({e})")
-    finally:
-        conn.close()
+        logger.error("ERROR: Could not record macro %s! (%s)", macro.name, e)
 
 
 def get_cal_goal(username: str, conn, cur):
@@ -295,27 +626,15 @@ def get_cal_goal(username: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
 
     Returns:
-        cal_goal: the user's calorie goal for the specified macro.
-    """
-
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT m.name, m.calGoal
-    FROM usermacros
-    JOIN macros AS m ON usermacros.macroID = m.id
-    WHERE usermacros.userID = ?
-    ORDER BY usermacros.macroID
-    DESC LIMIT 1
+        cal_goal: the user's calorie goal for the specified macro, or None if
+        the user does not exist or has no macro.
     """
 
     try:
-        cur.execute(sql, (user_id,))
-        cal_goal = cur.fetchone()[1]
-        return cal_goal
+        return (cur.execute(_SQL_CAL_GOAL, (username,)).fetchone() or
+                (None,))[0]
     except sqlite3.Error as e:
-        print(f"Error getting calorie goal for {username}! ({e})")
-    finally:
-        conn.close()
+        logger.error("Error getting calorie goal for %s! (%s)", username, e)
 
 
 def create_food(food: Food, conn, cur):
@@ -326,22 +645,41 @@ def create_food(food: Food, conn, cur):
         food: a Food object.
         conn (sqlite3.Connection): A connection object
         curr (sqlite3.Cursor): A cursor object for executing SQL queries
+
+    Returns:
+        food_id: the id of the new food item, or None if it was not created.
+    """
+
+    try:
+        with transaction(conn):
+            cur.execute(_SQL_INSERT_FOOD,
+                        (food.name, food.calories, food.protein, food.fat,
+                         food.carbs))
+        logger.info("Successfully logged %s into the database.", food.name)
+        return cur.lastrowid
+    except sqlite3.Error as e:
+        logger.error("Could not log %s into the database! (%s)", food.name, e)
+
+
+def create_foods(foods, conn, cur):
     """
+    Creates many food items with a single prepared statement and one commit.
 
-    sql = """
-    INSERT INTO foods(id, name, calories, protein, fat, carbs)
-    VALUES (?, ?, ?, ?, ?, ?)
+    Args:
+        foods: an iterable of Food objects.
+        conn (sqlite3.Connection): A connection object
+        curr (sqlite3.Cursor): A cursor object for executing SQL queries
     """
 
     try:
-        cur.execute(sql, (None, food.name, food.calories, food.protein,
-                          food.fat, food.carbs))
-        conn.commit()
-        print(f"Successfully logged {food.name} into the database.")
+        with transaction(conn):
+            cur.executemany(_SQL_INSERT_FOOD,
+                            [(food.name, food.calories, food.protein,
+                              food.fat, food.carbs) for food in foods])
+        logger.info("Successfully logged %s foods into the database.",
+                    cur.rowcount)
     except sqlite3.Error as e:
-        print(f"Could not log {food.name} into the database! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not log the foods into the database! (%s)", e)
 
 
 def select_food_item(food_name: str, conn, cur) -> str:
@@ -354,17 +692,13 @@ def select_food_item(food_name: str, conn, cur) -> str:
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
 
     Returns:
-        food_id: the id of the food specified.
+        food_id: the id of the food specified, or None if there is none.
     """
 
-    sql = "SELECT id FROM foods WHERE name=?"
-
     try:
-        cur.execute(sql, (food_name,))
-        food_id = cur.fetchone()[0]
-        return food_id
+        return _lookup_id("foods", "name", food_name, cur)
     except sqlite3.Error as e:
-        print(f"Could not fetch the id of {food_name}! ({e})")
+        logger.error("Could not fetch the id of %s! (%s)", food_name, e)
 
 
 def get_all_foods(conn, cur):
@@ -377,18 +711,16 @@ def get_all_foods(conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
 
     Returns:
-        food_list: a table of all foods stored in the database sorted in
-        descending order of calorie content.
+        food_list: a cursor over the (name, calories, protein, fat, carbs) of
+        all foods stored in the database sorted in descending order of
+        calorie content, rows are fetched as it is iterated. Nutrient
+        columns are returned as text for display, with missing ones as ''.
     """
 
     try:
-        cur.execute("SELECT * FROM foods ORDER BY calories DESC")
-        food_list = cur.fetchall()
-        return food_list
+        return conn.execute(_SQL_ALL_FOODS)
     except sqlite3.Error as e:
-        print(f"Could not retrieve all food items! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not retrieve all food items! (%s)", e)
 
 
 def update_food_item(food: Food, cols_to_update: list, conn,
@@ -404,30 +736,23 @@ def update_food_item(food: Food, cols_to_update: list, conn,
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    set_clause = ", ".join(f"{col} = ?" for col in cols_to_update)
-
-    sql = f"""
-    UPDATE foods
-    SET {set_clause}
-    WHERE name = ?
-    """
-
-    values = [getattr(food, col) for col in cols_to_update] + [food.name]
+    cols = tuple(sorted(cols_to_update))
+    sql = _update_sql("foods", "name", cols)
+    values = [getattr(food, col) for col in cols] + [food.name]
 
     try:
         cur.execute(sql, tuple(values))
-        conn.commit()
-        print(f"Successfully updated {food.name} in the database.")
+        logger.info("Successfully updated %s in the database.", food.name)
     except sqlite3.Error as e:
-        print(f"Could not update {food.name} in the database! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not update %s in the database! (%s)", food.name, e)
 
 
 def create_entry(username: str, food_name: str, conn, cur):
     """
     Creates a foodentry for a user, indicating they consumed this food on the
-    given date. Date defaults to current day and time.
+    given date. Date defaults to current day and time. The user and food ids
+    are resolved by the INSERT itself, so nothing is inserted if either one
+    does not exist.
 
     Args:
         username: a string representing the user who is logging the entry.
@@ -436,24 +761,48 @@ def create_entry(username: str, food_name: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    user_id = select_specific_user(username, conn, cur)
-    food_id = select_food_item(food_name, conn, cur)
-    sql = "INSERT INTO foodentries(foodID, userID) VALUES(?, ?)"
+    try:
+        cur.execute(_SQL_INSERT_ENTRY, (food_name, username))
+        if cur.rowcount:
+            logger.info("Successfully recorded this entry for user %s",
+                        username)
+        else:
+            logger.error("Could not log this entry! (no user %s or food %s)",
+                         username, food_name)
+    except sqlite3.Error as e:
+        logger.error("Could not log this entry! (%s)", e)
+
+
+def create_entries(username: str, food_names, conn, cur):
+    """
+    Creates a foodentry for each of the given foods for a user with a single
+    prepared statement and one commit. Date defaults to current day and time.
+
+    Args:
+        username: a string representing the user who is logging the entries.
+        food_names: an iterable of the names of the foods consumed.
+        conn (sqlite3.Connection): A connection object.
+        curr (sqlite3.Cursor): A cursor object for executing SQL queries.
+    """
 
+    rows = [(food_name, username) for food_name in food_names]
     try:
-        cur.execute(sql, (food_id, user_id))
-        conn.commit()
-        print(f"Successfully recorded this entry for user {username}")
+        with transaction(conn):
+            cur.executemany(_SQL_INSERT_ENTRY, rows)
+            if cur.rowcount != len(rows):
+                raise sqlite3.IntegrityError(
+                    f"no user {username} or one of the foods")
+        logger.info("Successfully recorded %s entries for user %s",
+                    len(rows), username)
     except sqlite3.Error as e:
-        print(f"Could not log this entry! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not log these entries! (%s)", e)
 
 
 def adjust_entry(username: str, food_name: str, date: str, conn, cur):
     """
     Adjusts a foodentry for a user. Only allows you to retroactively add to
-    your daily diary.
+    your daily diary. Like create_entry, nothing is inserted if the user or
+    food does not exist.
 
     Args:
         username: a string representing the user who is logging the entry.
@@ -463,18 +812,16 @@ def adjust_entry(username: str, food_name: str, date: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    user_id = select_specific_user(username, conn, cur)
-    food_id = select_food_item(food_name, conn, cur)
-    sql = "INSERT INTO foodentries(foodID, userID, date) VALUES(?, ?, ?)"
-
     try:
-        cur.execute(sql, (food_id, user_id, date))
-        conn.commit()
-        print(f"Successfully adjusted this entry for user {username}")
+        cur.execute(_SQL_ADJUST_ENTRY, (date, food_name, username))
+        if cur.rowcount:
+            logger.info("Successfully adjusted this entry for user %s",
+                        username)
+        else:
+            logger.error("Could not adjust this entry! (no user %s or food "
+                         "%s)", username, food_name)
     except sqlite3.Error as e:
-        print(f"Could not adjust this entry! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not adjust this entry! (%s)", e)
 
 
 def show_current_entry(username: str, conn, cur):
@@ -486,27 +833,15 @@ def show_current_entry(username: str, conn, cur):
         conn (sqlite3.Connection): A connection object.
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     Returns:
-        rows: a table showing all entries a user has made for today.
-    """
-
-    today = datetime.date.today().isoformat()
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT users.username, foods.name AS food, foods.calories, foodentries.time
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE users.id = ? AND date = ?
+        rows: a cursor over (time, food, calories) for each entry a user has
+        made today, in the order they were logged.
     """
 
     try:
-        cur.execute(sql, (user_id, today))
-        rows = cur.fetchall()
-        return rows
+        return conn.execute(_SQL_ENTRIES_TODAY, (username,))
     except sqlite3.Error as e:
-        print(f"Could not fetch entries for {username} on {today}! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch today's entries for %s! (%s)",
+                     username, e)
 
 
 def show_weekly_entries(username: str, conn, cur):
@@ -518,27 +853,14 @@ def show_weekly_entries(username: str, conn, cur):
         conn (sqlite3.Connection): A connection object.
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     Returns:
-        rows: a table showing all entries a user has made for the current week.
-    """
-
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT users.username, foods.name, foods.calories, foodentries.date
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE foodentries.date BETWEEN DATE('now', 'weekday 0', '-6 days') AND DATE
-    ('now', 'weekday 0') AND users.id = ?
+        rows: a cursor over all entries a user has made for the current week.
     """
 
     try:
-        cur.execute(sql, (user_id,))
-        rows = cur.fetchall()
-        return rows
+        return conn.execute(_SQL_ENTRIES_WEEK, (username,))
     except sqlite3.Error as e:
-        print(f"Could not fetch the weekly entries for {username}! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch the weekly entries for %s! (%s)",
+                     username, e)
 
 
 def show_monthly_entries(username: str, conn, cur):
@@ -550,28 +872,14 @@ def show_monthly_entries(username: str, conn, cur):
         conn (sqlite3.Connection): A connection object.
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     Returns:
-        rows:a table showing all entries a user has made for the current month.
-    """
-
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT users.username, foods.name, foods.calories, foodentries.date
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE foodentries.date BETWEEN DATE('now', 'start of month') AND
-    DATE('now', 'start of month', '+1 month', '-1 day') AND users.id = ?
-    ORDER BY foodentries.date ASC
+        rows: a cursor over all entries a user has made for the current month.
     """
 
     try:
-        cur.execute(sql, (user_id,))
-        rows = cur.fetchall()
-        return rows
+        return conn.execute(_SQL_ENTRIES_MONTH, (username,))
     except sqlite3.Error as e:
-        print(f"Could not fetch the monthly entries for {username}! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch the monthly entries for %s! (%s)",
+                     username, e)
 
 
 def get_total_calories_today(username: str, conn, cur):
@@ -584,24 +892,11 @@ def get_total_calories_today(username: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    today = datetime.date.today().isoformat()
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT SUM(foods.calories)
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE users.id = ? AND date = ?
-    """
-
     try:
-        cur.execute(sql, (user_id, today))
-        total_calories = cur.fetchone()[0]
-        return total_calories
+        return cur.execute(_SQL_TOTAL_TODAY, (username,)).fetchone()[0]
     except sqlite3.Error as e:
-        print(f"Could not fetch {username}'s calories for {today}! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch %s's calories for today! (%s)",
+                     username, e)
 
 
 def get_weekly_calories(username: str, conn, cur):
@@ -614,24 +909,10 @@ def get_weekly_calories(username: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT SUM(foods.calories)
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE foodentries.date BETWEEN DATE('now', 'weekday 0', '-6 days') AND DATE
-    ('now', 'weekday 0') AND users.id = ?
-    """
-
     try:
-        cur.execute(sql, (user_id,))
-        weekly_calories = cur.fetchone()[0]
-        return weekly_calories
+        return cur.execute(_SQL_TOTAL_WEEK, (username,)).fetchone()[0]
     except sqlite3.Error as e:
-        print(f"Could not fetch {username}'s weekly calories! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch %s's weekly calories! (%s)", username, e)
 
 
 def get_monthly_calories(username: str, conn, cur):
@@ -644,41 +925,119 @@ def get_monthly_calories(username: str, conn, cur):
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    user_id = select_specific_user(username, conn, cur)
-    sql = """
-    SELECT SUM(foods.calories)
-    FROM foodentries
-    JOIN users ON foodentries.userID = users.id
-    JOIN foods ON foodentries.foodID = foods.id
-    WHERE foodentries.date BETWEEN DATE('now', 'start of month') AND
-    DATE('now', 'start of month', '+1 month', '-1 day') AND users.id = ?
+    try:
+        return cur.execute(_SQL_TOTAL_MONTH, (username,)).fetchone()[0]
+    except sqlite3.Error as e:
+        logger.error("Could not fetch %s's monthly calories! (%s)",
+                     username, e)
+
+
+def _unpack_bundle(rows):
+    """
+    Splits the rows of a bundle query into entries, total and calorie goal.
+    Only the first row is fetched up front, the entries stream from rows.
+
+    Args:
+        rows: a cursor over (username, food, calories, time/date, total,
+        goal). A user without any entries yields a single row with a NULL
+        food.
+
+    Returns:
+        A tuple containing:
+            entries: an iterator of (username, food, calories, time/date),
+            calories as text.
+            total: the total calories of the entries.
+            cal_goal: the user's calorie goal.
+    """
+
+    first = next(rows, None)
+    if first is None:
+        return iter(()), 0, None
+    if first[1] is None:
+        return iter(()), 0, first[5]
+    entries = (row[:4] for row in itertools.chain((first,), rows))
+    return entries, first[4], first[5]
+
+
+def show_day_bundle(username: str, conn, cur):
+    """
+    Fetches today's entries, their total calories and the user's calorie goal
+    in a single query.
+
+    Args:
+        username: a string representing the user
+        conn (sqlite3.Connection): A connection object.
+        curr (sqlite3.Cursor): A cursor object for executing SQL queries.
+    Returns:
+        A tuple of (entries, total_calories, cal_goal).
+    """
+
+    try:
+        return _unpack_bundle(
+            conn.execute(_SQL_BUNDLE_TODAY, (username,)))
+    except sqlite3.Error as e:
+        logger.error("Could not fetch %s's food diary for today! (%s)",
+                     username, e)
+
+
+def show_weekly_bundle(username: str, conn, cur):
+    """
+    Fetches the current week's entries (Sunday - Saturday), their total
+    calories and the user's daily calorie goal in a single query.
+
+    Args:
+        username: a string representing the user
+        conn (sqlite3.Connection): A connection object.
+        curr (sqlite3.Cursor): A cursor object for executing SQL queries.
+    Returns:
+        A tuple of (entries, weekly_calories, cal_goal).
+    """
+
+    try:
+        return _unpack_bundle(conn.execute(_SQL_BUNDLE_WEEK, (username,)))
+    except sqlite3.Error as e:
+        logger.error("Could not fetch %s's weekly food diary! (%s)",
+                     username, e)
+
+
+def show_monthly_bundle(username: str, conn, cur):
+    """
+    Fetches the current month's entries, their total calories and the user's
+    daily calorie goal in a single query.
+
+    Args:
+        username: a string representing the user
+        conn (sqlite3.Connection): A connection object.
+        curr (sqlite3.Cursor): A cursor object for executing SQL queries.
+    Returns:
+        A tuple of (entries, monthly_calories, cal_goal).
     """
 
     try:
-        cur.execute(sql, (user_id,))
-        monthly_calories = cur.fetchone()[0]
-        return monthly_calories
+        return _unpack_bundle(conn.execute(_SQL_BUNDLE_MONTH, (username,)))
     except sqlite3.Error as e:
-        print(f"Could not fetch {username}'s monthly calories! ({e})")
-    finally:
-        conn.close()
+        logger.error("Could not fetch %s's monthly food diary! (%s)",
+                     username, e)
 
 
 def create_all_tables(conn, cur):
     """
-    Creates all tables for the calories database.
+    Creates all tables for the calories database in a single script. Skipped
+    when the database's user_version shows the schema is already up to date.
 
     Args:
         conn (sqlite3.Connection): A connection object.
         curr (sqlite3.Cursor): A cursor object for executing SQL queries.
     """
 
-    create_users_table(conn, cur)
-    conn, cur = create_connection()
-    create_macros_table(conn, cur)
-    conn, cur = create_connection()
-    create_usermacros_table(conn, cur)
-    conn, cur = create_connection()
-    create_foods_table(conn, cur)
-    conn, cur = create_connection()
-    create_foodentries_table(conn, cur)
+    try:
+        cur.execute("PRAGMA user_version")
+        if cur.fetchone()[0] >= SCHEMA_VERSION:
+            return
+        cur.executescript(
+            "BEGIN;" + ";\n".join(SCHEMA.values()) +
+            f";\nPRAGMA user_version = {SCHEMA_VERSION};\nCOMMIT;")
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.rollback()
+        logger.error("ERROR: could not create tables! (%s)", e)
@@ -1,74 +1,48 @@
 import datetime
+from typing import NamedTuple, Optional
 
 
-class User:
+class User(NamedTuple):
     """
     Represents the user table.
-
-    username: str
-    weight: int
-    weight_goal: int
-
     """
 
-    def __init__(self, username, weight=None, weightGoal=None):
-        self.username = username
-        self.weight = weight
-        self.weightGoal = weightGoal
+    username: str
+    weight: Optional[int] = None
+    weightGoal: Optional[int] = None
 
 
-class Macro:
+class Macro(NamedTuple):
     """
     Represents the macro table.
-
-    name: str
-    protein_alloc: int
-    fatAllocation: int
-    carbAllocation: int
-    calGoal: int
     """
 
-    def __init__(self, name, protein_pct, fat_pct, carb_pct, cal_goal):
-
-        self.name = name
-        self.protein_pct = protein_pct
-        self.fat_pct = fat_pct
-        self.carb_pct = carb_pct
-        self.cal_goal = cal_goal
+    name: str
+    protein_pct: int
+    fat_pct: int
+    carb_pct: int
+    cal_goal: int
 
 
-class UserMacro:
+class UserMacro(NamedTuple):
     """
     Represents the usermacro intersection table.
+    """
 
     user_id: int
     macro_id: int
-    """
-
-    def __init__(self, user_id, macro_id):
 
-        self.user_id = user_id
-        self.macro_id = macro_id
 
-
-class Food:
+class Food(NamedTuple):
     """
     Represents the foods table.
-
-    name: str
-    calories: int
-    protein: int
-    fat: int
-    carbs: int
     """
 
-    def __init__(self, name, calories=0, protein=0,  fat=0, carbs=0):
-
-        self.name = name
-        self.calories = calories
-        self.protein = protein
-        self.fat = fat
-        self.carbs = carbs
+    name: str
+    calories: int = 0
+    protein: int = 0
+    fat: int = 0
+    carbs: int = 0
 
 
 class FoodEntry:
@@ -78,14 +52,17 @@ class FoodEntry:
     entry_id: int
     food_id: int
     user_id: int
-    date: current date
+    date: the given date, or the current UTC date
 
     """
 
-    def __init__(self, entry_id, food_id, user_id, date):
+    __slots__ = ("entry_id", "food_id", "user_id", "date")
+
+    def __init__(self, entry_id, food_id, user_id, date=None):
 
         self.entry_id = entry_id
         self.food_id = food_id
         self.user_id = user_id
-        self.date = date if not date else datetime.datetime.now().isoformat()
-        # TODO: fix this date implementation
+        self.date = date or (
+            datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        )